@@ -1,59 +1,92 @@
-import os
-from dotenv import load_dotenv
-from dataclasses import dataclass
+import asyncio
+import logging
+import re
+import operator
+from functools import lru_cache
+from typing import Annotated, TypedDict
 from langgraph.graph import StateGraph, END
-from tavily import TavilyClient  # ✅ Tavily for web search
-from huggingface_hub import InferenceClient
-from bert_score import score  # ✅ BERTScore for better accuracy evaluation
+from langgraph.types import StreamWriter
+from checkpoints import ANSWER_OK, run_query, stream_query  # ✅ Reuse answers for repeated queries
+from clients import acached_search, get_hf_model, get_tavily_client, inference_client, run_sync, stream_answer  # ✅ Shared Tavily + Hugging Face clients
+from llm_cache import get_llm_cache  # ✅ Exact + semantic cache for LLM answers
+from research_context import answer_token_budget, build_research_context, semantic_digest  # ✅ Prompt + generation budgets
+from bert_score import BERTScorer  # ✅ BERTScore for better accuracy evaluation
+from bert_score.utils import model2layers
 import torch
 
-# ✅ Load API Keys from .env file
-load_dotenv()
-tavily_api_key = os.getenv("TAVILY_API_KEY")
-huggingface_api_key = os.getenv("HUGGINGFACEHUB_API_KEY")
+log = logging.getLogger(__name__)
 
-# ✅ Validate API Keys
-if not tavily_api_key:
-    raise ValueError("❌ Tavily API key is missing. Check your .env file.")
+# ✅ Markers of corrupted AI output, matched in a single pass
+CORRUPTED_OUTPUT_PATTERN = re.compile(r"--c2-|\( \( \(|< \( \(")
 
-# ✅ Initialize Tavily Client
-client = TavilyClient(api_key=tavily_api_key)
+# ✅ Number of Tavily sub-queries searched in parallel
+NUM_SUBQUERIES = 3
+SEARCH_FACETS = ["overview", "latest findings"]
 
 # ✅ Define Research State
-@dataclass
-class ResearchState:
+class ResearchState(TypedDict):
     query: str
-    research_data: list
+    research_data: Annotated[list, operator.add]  # ✅ Merges parallel search results
     answer_draft: str
+    status: str  # ✅ ANSWER_OK once the draft is a reusable answer
+    subqueries: list
 
-def research_agent(state: ResearchState):
-    """Uses TavilyClient to get high-quality web search results."""
-    print(f"🔍 Researching: {state.query}")
-    
-    try:
-        response = client.search(query=state.query, num_results=5)
-        research_data = [res.get("content", "No content available.") for res in response.get("results", [])]
+def planner_agent(state: ResearchState):
+    """Decomposes the query into sub-queries that are searched in parallel."""
+    query = state["query"]
+    subqueries = [query] + [f"{query} {facet}" for facet in SEARCH_FACETS]
+    return {"subqueries": subqueries[:NUM_SUBQUERIES]}
 
-        # ✅ Filter out empty or low-quality search results
-        filtered_data = [res for res in research_data if "No content" not in res and len(res) > 50]
+def make_research_agent(index):
+    """Builds the search node that handles the sub-query at `index`."""
+    async def research_agent(state: ResearchState):
+        """Uses TavilyClient to get high-quality web search results."""
+        if index >= len(state["subqueries"]):
+            return {"research_data": []}
 
-        if not filtered_data:
-            print("⚠️ No useful search results found.")
-            filtered_data = ["No relevant search results."]
+        subquery = state["subqueries"][index]
+        client = get_tavily_client()  # ✅ Raises here if the Tavily API key is missing
+        log.info("🔍 Researching: %s", subquery)
 
-        return ResearchState(query=state.query, research_data=filtered_data, answer_draft="")
-    
-    except Exception as e:
-        print(f"❌ Tavily API error: {e}")
-        return ResearchState(query=state.query, research_data=["Error fetching results"], answer_draft="")
+        try:
+            response = await acached_search(client, subquery, num_results=5)
+            research_data = [res.get("content", "No content available.") for res in response.get("results", [])]
+
+            # ✅ Filter out empty or low-quality search results
+            filtered_data = [res for res in research_data if "No content" not in res and len(res) > 50]
+
+            return {"research_data": filtered_data}
+
+        except Exception as e:
+            log.error("❌ Tavily API error: %s", e)
+            return {"research_data": []}
+
+    return research_agent
+
+# ✅ Default Hugging Face model; override with HF_MODEL / HF_PROVIDER in .env
+DEFAULT_HF_MODEL = "HuggingFaceH4/zephyr-7b-beta"
 
-# ✅ Initialize Hugging Face Client with a better model
-hf_client = InferenceClient(model="HuggingFaceH4/zephyr-7b-beta")
+# ✅ Keeps this script's cached answers and checkpoints apart from the other scripts' prompt templates
+PROMPT_NAMESPACE = "accuracy"
 
+def open_hf_client():
+    """Lends this event loop's Hugging Face client for one request; use it with `async with`."""
+    return inference_client(get_hf_model(DEFAULT_HF_MODEL))
 
-def answer_drafting_agent(state: ResearchState):
+
+async def answer_drafting_agent(state: ResearchState, writer: StreamWriter):
     """Generates an answer using Hugging Face inference API with improved prompt engineering."""
-    print("✍️ Generating answer using Hugging Face...")
+    log.info("✍️ Generating answer using Hugging Face...")
+
+    research_data = state["research_data"]
+    if not research_data:
+        log.warning("⚠️ No useful search results found.")
+        research_data = ["No relevant search results."]
+
+    # ✅ Keep the prompt short: drop near-duplicate snippets and cap the context size
+    research_context = build_research_context(research_data)
+
+    llm_cache = get_llm_cache(get_hf_model(DEFAULT_HF_MODEL), PROMPT_NAMESPACE)
 
     try:
         prompt = f"""
@@ -62,12 +95,16 @@ def answer_drafting_agent(state: ResearchState):
         Avoid assumptions and provide structured, well-cited responses.
 
         Research Data:
-        {state.research_data}
+        {research_context}
 
         Output a fact-checked, well-structured response.
         """
 
-        response = hf_client.text_generation(prompt, max_new_tokens=500)
+        # ✅ Serve repeated or near-duplicate prompts from the cache, streaming fresh answers token by token
+        semantic_text = semantic_digest(state["query"], research_data)
+        response, cached = await stream_answer(
+            open_hf_client, llm_cache, prompt, writer, answer_token_budget(state["query"]), semantic_text
+        )
 
         if isinstance(response, str):
             answer_text = response.strip()
@@ -76,44 +113,116 @@ def answer_drafting_agent(state: ResearchState):
         else:
             answer_text = "Error: No answer generated."
 
+        status = ANSWER_OK if state["research_data"] else "no_results"
         # ✅ Sanitize output and check for AI hallucinations
-        if not answer_text or any(char in answer_text for char in ["--c2-", "( ( (", "< ( ("]):
-            print("⚠️ Invalid AI response detected. Retrying...")
+        if not answer_text or CORRUPTED_OUTPUT_PATTERN.search(answer_text):
+            log.warning("⚠️ Invalid AI response detected. Retrying...")
             answer_text = "Error: The AI response was corrupted. Please try again."
+            status = "error"
+        elif not cached and state["research_data"]:
+            # ✅ Drafts built from the no-results fallback aren't cached
+            await asyncio.to_thread(llm_cache.set, prompt, response, semantic_text)
 
-        return ResearchState(query=state.query, research_data=state.research_data, answer_draft=answer_text)
+        return {"answer_draft": answer_text, "status": status}
     
     except Exception as e:
-        print(f"❌ Hugging Face API error: {e}")
-        return ResearchState(query=state.query, research_data=state.research_data, answer_draft="Error fetching response.")
+        log.error("❌ Hugging Face API error: %s", e)
+        return {"answer_draft": "Error fetching response.", "status": "error"}
 
 # ✅ Define LangGraph Workflow
 graph = StateGraph(ResearchState)
-graph.add_node("research", research_agent)
+graph.add_node("planner", planner_agent)
 graph.add_node("draft", answer_drafting_agent)
 
-graph.add_edge("research", "draft")
+# ✅ Fan out to parallel search nodes, fan in to the single writer
+for i in range(NUM_SUBQUERIES):
+    graph.add_node(f"search_{i + 1}", make_research_agent(i))
+    graph.add_edge("planner", f"search_{i + 1}")
+    graph.add_edge(f"search_{i + 1}", "draft")
+
 graph.add_edge("draft", END)
-graph.set_entry_point("research")
+graph.set_entry_point("planner")
 
+# ✅ Compile once at import; each run binds its own on-disk checkpoint store
 executor = graph.compile()
 
-def evaluate_accuracy(predicted_answer, reference_answer):
-    """Computes accuracy using BERTScore."""
-    P, R, F1 = score([predicted_answer], [reference_answer], lang="en", model_type="microsoft/deberta-xlarge-mnli")
+# ✅ BERTScore model settings
+BERTSCORE_MODEL = "microsoft/deberta-xlarge-mnli"
+BERTSCORE_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+
+# ✅ Layer whose embeddings BERTScore uses; layers above it are dropped from the encoder when it loads
+BERTSCORE_NUM_LAYERS = model2layers[BERTSCORE_MODEL]
+
+@lru_cache(maxsize=1)
+def _get_scorer():
+    """Loads the BERTScore model once and reuses it for every evaluation."""
+    # ✅ The baseline file is read once here and reused for every rescaled score
+    scorer = BERTScorer(
+        model_type=BERTSCORE_MODEL,
+        lang="en",
+        device=BERTSCORE_DEVICE,
+        num_layers=BERTSCORE_NUM_LAYERS,
+        batch_size=64,
+        idf=False,
+        rescale_with_baseline=True,
+    )
+
+    # ✅ Run the encoder in fp16 on GPU tensor cores
+    if BERTSCORE_DEVICE == "cuda":
+        scorer._model.half()
+
+        # ✅ Fuse the encoder's attention/matmul kernels; dynamic shapes avoid a recompile per padded length
+        if hasattr(torch, "compile"):
+            scorer._model = torch.compile(scorer._model, dynamic=True)
+
+    return scorer
+
+def evaluate_accuracy(preds: list[str], refs: list[str]) -> float:
+    """Computes the mean BERTScore F1 over prediction/reference pairs in batched forward passes.
+
+    Takes equal-length lists of strings and returns NaN when there are no pairs;
+    use `evaluate_answer_accuracy` to score a single pair.
+    """
+    if isinstance(preds, str) or isinstance(refs, str):
+        raise TypeError("evaluate_accuracy expects lists of strings; use evaluate_answer_accuracy for a single pair.")
+    preds, refs = list(preds), list(refs)
+    if len(preds) != len(refs):
+        raise ValueError(f"Got {len(preds)} predictions for {len(refs)} references.")
+    if not preds:
+        return float("nan")
+
+    scorer = _get_scorer()
+    use_fp16 = BERTSCORE_DEVICE == "cuda"
+
+    # ✅ BERTScorer.score already dedups and length-sorts sentences before batching, so batches stay tightly padded
+    with torch.inference_mode(), torch.autocast("cuda", dtype=torch.float16, enabled=use_fp16):
+        P, R, F1 = scorer.score(preds, refs)
     return F1.mean().item()
 
-def run_research_system(user_query):
+def evaluate_answer_accuracy(predicted_answer, reference_answer):
+    """Computes accuracy of a single answer using BERTScore."""
+    return evaluate_accuracy([predicted_answer], [reference_answer])
+
+async def arun_research_system(user_query):
     """Executes research and AI-generated answering system."""
-    state = ResearchState(query=user_query, research_data=[], answer_draft="")
-    final_state = executor.invoke(state)
+    state = ResearchState(query=user_query, research_data=[], answer_draft="", subqueries=[], status="")
+    return await run_query(executor, state, PROMPT_NAMESPACE)
+
+def run_research_system(user_query):
+    """Runs the research system to completion from synchronous code."""
+    return run_sync(arun_research_system(user_query))
 
-    if isinstance(final_state, dict):  
-        final_state = ResearchState(**final_state)
+async def run_many(queries):
+    """Runs the research system for several queries concurrently; they share one Hugging Face client."""
+    return await asyncio.gather(*(arun_research_system(query) for query in queries))
 
-    return final_state.answer_draft if isinstance(final_state, ResearchState) else "Error: Unexpected state."
+def stream_research_system(user_query):
+    """Yields {"token": ...} events while the answer is generated, then {"answer": ...}."""
+    state = ResearchState(query=user_query, research_data=[], answer_draft="", subqueries=[], status="")
+    return stream_query(executor, state, PROMPT_NAMESPACE)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     query = input("Enter your research query: ")
     answer = run_research_system(query)
 
@@ -121,7 +230,7 @@ if __name__ == "__main__":
     reference_answer = "The common cold is a viral infection that affects the respiratory system, typically caused by rhinovirus. Symptoms include congestion, sneezing, sore throat, and mild fatigue. Treatment focuses on symptom relief, including decongestants, pain relievers, and hydration."
 
     # ✅ Evaluate accuracy using BERTScore
-    accuracy_score = evaluate_accuracy(answer, reference_answer)
+    accuracy_score = evaluate_answer_accuracy(answer, reference_answer)
 
     print("\n💡 Final Answer:\n", answer)
     print(f"✅ Accuracy Score: {accuracy_score:.2f}")
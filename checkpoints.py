@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import time
+import weakref
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from clients import TAVILY_CACHE_TTL
+
+# ✅ Checkpoints live on disk so repeated queries reuse answers across runs and restarts
+CHECKPOINT_PATH = ".checkpoints.sqlite"
+
+# ✅ Finished answers go stale together with the Tavily results they were drafted from
+CHECKPOINT_TTL = TAVILY_CACHE_TTL
+
+# ✅ Draft status that marks a finished answer as reusable; anything else reruns the query
+ANSWER_OK = "ok"
+
+# ✅ Per-thread locks, dropped automatically once no run holds them
+_thread_locks = weakref.WeakValueDictionary()
+
+
+@asynccontextmanager
+async def checkpointed(executor):
+    """Yields the compiled `executor` bound to the on-disk checkpoint store, open for the current run only."""
+    async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_PATH) as saver:
+        await saver.setup()
+        await _delete_expired_threads(saver)
+        # ✅ Rebinding is a shallow copy; the graph itself is compiled once at import
+        yield executor.copy(update={"checkpointer": saver})
+
+
+async def _delete_expired_threads(saver):
+    """Deletes every thread whose last run started more than CHECKPOINT_TTL seconds ago."""
+    async with saver.lock:
+        await saver.conn.execute(
+            "CREATE TABLE IF NOT EXISTS thread_expiry (thread_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)"
+        )
+        async with saver.conn.execute(
+            "SELECT thread_id FROM thread_expiry WHERE expires_at <= ?", (time.time(),)
+        ) as cursor:
+            expired = [row[0] for row in await cursor.fetchall()]
+
+    for thread_id in expired:
+        await saver.adelete_thread(thread_id)
+
+    async with saver.lock:
+        await saver.conn.executemany("DELETE FROM thread_expiry WHERE thread_id = ?", [(thread_id,) for thread_id in expired])
+        await saver.conn.commit()
+
+
+def query_config(user_query, namespace=""):
+    """Returns the run config whose checkpoint thread is shared by every run of `user_query` in `namespace`."""
+    thread_id = hashlib.sha256(f"{namespace}\n{user_query}".encode("utf-8")).hexdigest()
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def thread_lock(config):
+    """Returns the lock that serializes concurrent runs on the config's thread."""
+    key = (asyncio.get_running_loop(), config["configurable"]["thread_id"])
+    lock = _thread_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _thread_locks[key] = lock
+    return lock
+
+
+async def finished_answer(executor, config):
+    """Returns the answer of a completed, successful run on the config's thread from the last CHECKPOINT_TTL seconds, or None."""
+    snapshot = await executor.aget_state(config)
+    answer = snapshot.values.get("answer_draft")
+    if snapshot.next or snapshot.values.get("status") != ANSWER_OK or not answer or not snapshot.created_at:
+        return None
+
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(snapshot.created_at)
+    if age.total_seconds() > CHECKPOINT_TTL:
+        return None
+    return answer
+
+
+async def clear_thread(executor, config):
+    """Deletes every checkpoint on the config's thread so the next run starts from an empty state.
+
+    The fresh thread is deleted CHECKPOINT_TTL seconds later unless the query runs again.
+    """
+    saver = executor.checkpointer
+    thread_id = config["configurable"]["thread_id"]
+    await saver.adelete_thread(thread_id)
+    async with saver.lock:
+        await saver.conn.execute(
+            "INSERT OR REPLACE INTO thread_expiry (thread_id, expires_at) VALUES (?, ?)",
+            (thread_id, time.time() + CHECKPOINT_TTL),
+        )
+        await saver.conn.commit()
+
+
+async def run_query(executor, state, namespace):
+    """Runs the compiled `executor` on `state`, reusing a recent finished answer for the same query in `namespace`."""
+    config = query_config(state["query"], namespace)
+
+    # ✅ Checkpoint every run on disk so a repeated query reuses the finished answer
+    async with thread_lock(config), checkpointed(executor) as executor:
+        answer = await finished_answer(executor, config)
+        if answer is not None:
+            return answer
+
+        # ✅ Drop a failed earlier run so its research_data isn't merged into this one
+        await clear_thread(executor, config)
+        final_state = await executor.ainvoke(state, config=config)
+
+    return final_state["answer_draft"] or "Error: No answer generated."
+
+
+async def stream_query(executor, state, namespace):
+    """Like `run_query`, but yields {"token": ...} events while the answer is generated, then {"answer": ...}."""
+    config = query_config(state["query"], namespace)
+    final_state = None
+
+    async with thread_lock(config), checkpointed(executor) as executor:
+        answer = await finished_answer(executor, config)
+        if answer is not None:
+            yield {"answer": answer}
+            return
+
+        await clear_thread(executor, config)
+        async for mode, chunk in executor.astream(state, config=config, stream_mode=["custom", "values"]):
+            if mode == "custom":
+                yield chunk
+            else:
+                final_state = chunk
+
+    yield {"answer": final_state["answer_draft"] if final_state else "Error: No answer generated."}
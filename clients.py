@@ -0,0 +1,219 @@
+import os
+import asyncio
+import hashlib
+import json
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+from tavily import TavilyClient  # ✅ Tavily for web search
+from huggingface_hub import AsyncInferenceClient
+from llm_cache import LLMCache, SQLiteBackend
+from research_context import STOP_SEQUENCES
+
+# ✅ Hard cap on how long a Hugging Face call may block the graph
+HF_TIMEOUT = 30
+
+# ✅ Keep the inference server's cache enabled
+HF_HEADERS = {"x-use-cache": "true"}
+
+# ✅ A client keeps every streamed response on its exit stack until it closes, so long-lived loops recycle it
+HF_CLIENT_MAX_LEASES = 256
+
+# ✅ Hugging Face clients per event loop: their HTTP session can't be used from any other loop
+_loop_clients = weakref.WeakKeyDictionary()
+
+# ✅ Repeated Tavily searches are served from disk for an hour
+TAVILY_CACHE_PATH = ".tavily_cache.sqlite"
+TAVILY_CACHE_TTL = 3600
+
+# ✅ Bounded pool for blocking Tavily calls from async nodes
+TAVILY_MAX_WORKERS = 8
+_tavily_pool = ThreadPoolExecutor(max_workers=TAVILY_MAX_WORKERS, thread_name_prefix="tavily")
+
+
+@lru_cache(maxsize=1)
+def _load_env() -> None:
+    """Loads the .env file on first use instead of at import."""
+    load_dotenv()
+
+
+def get_tavily_api_key() -> str:
+    """Returns the Tavily API key, raising if it is not configured."""
+    _load_env()
+    api_key = os.getenv("TAVILY_API_KEY")
+    if not api_key:
+        raise ValueError("❌ Tavily API key is missing. Check your .env file.")
+    return api_key
+
+
+def get_huggingface_api_key() -> str:
+    """Returns the Hugging Face API key, raising if it is not configured."""
+    _load_env()
+    api_key = os.getenv("HUGGINGFACEHUB_API_KEY")
+    if not api_key:
+        raise ValueError("❌ Hugging Face API key is missing. Check your .env file.")
+    return api_key
+
+
+def get_hf_model(default: str) -> str:
+    """Returns the model named in HF_MODEL, falling back to the script's `default`."""
+    _load_env()
+    return os.getenv("HF_MODEL") or default
+
+
+def _new_inference_client(model: str, token: Optional[str]) -> AsyncInferenceClient:
+    """Returns a new AsyncInferenceClient for `model`, routed through HF_PROVIDER when set."""
+    _load_env()
+    provider = os.getenv("HF_PROVIDER")
+    provider_kwargs = {"provider": provider} if provider else {}
+    return AsyncInferenceClient(
+        model=model, token=token, timeout=HF_TIMEOUT, headers=dict(HF_HEADERS), **provider_kwargs
+    )
+
+
+class _LoopClient:
+    """An AsyncInferenceClient owned by one event loop, with its lease counts."""
+
+    def __init__(self, client: AsyncInferenceClient):
+        self.client = client
+        self.leases = 0
+        self.active = 0
+        self.retired = False
+
+    async def retire(self) -> None:
+        """Stops new leases and closes the client once no lease is using it."""
+        self.retired = True
+        if not self.active:
+            await self.client.close()
+
+
+@asynccontextmanager
+async def inference_client(model: str, token: Optional[str] = None):
+    """Lends the running loop's AsyncInferenceClient for `model`.
+
+    Runs on the same loop share the client and its connections. It is swapped for a fresh one
+    after HF_CLIENT_MAX_LEASES leases and otherwise stays open until `close_inference_clients`.
+    """
+    clients = _loop_clients.setdefault(asyncio.get_running_loop(), {})
+    entry = clients.get((model, token))
+    if entry is None or entry.leases >= HF_CLIENT_MAX_LEASES:
+        if entry is not None:
+            await entry.retire()
+        entry = clients[(model, token)] = _LoopClient(_new_inference_client(model, token))
+
+    entry.leases += 1
+    entry.active += 1
+    try:
+        yield entry.client
+    finally:
+        entry.active -= 1
+        if entry.retired and not entry.active:
+            await entry.client.close()
+
+
+async def close_inference_clients() -> None:
+    """Closes the running loop's Hugging Face clients; call it before the loop shuts down."""
+    for entry in _loop_clients.pop(asyncio.get_running_loop(), {}).values():
+        await entry.retire()
+
+
+def run_sync(coro):
+    """Runs `coro` in a new event loop with asyncio.run, closing that loop's Hugging Face clients before it exits."""
+    async def main():
+        try:
+            return await coro
+        finally:
+            await close_inference_clients()
+
+    return asyncio.run(main())
+
+
+@lru_cache(maxsize=1)
+def get_tavily_client() -> TavilyClient:
+    """Returns the process-wide TavilyClient."""
+    return TavilyClient(api_key=get_tavily_api_key())
+
+
+@lru_cache(maxsize=1)
+def _get_tavily_cache() -> SQLiteBackend:
+    return SQLiteBackend(TAVILY_CACHE_PATH)
+
+
+def _search_key(query: str, num_results: int) -> str:
+    return hashlib.sha256(json.dumps([query, num_results]).encode("utf-8")).hexdigest()
+
+
+def _get_cached_search(query: str, num_results: int) -> Optional[dict]:
+    cached = _get_tavily_cache().get(_search_key(query, num_results))
+    return json.loads(cached) if cached is not None else None
+
+
+def _search_and_store(client: TavilyClient, query: str, num_results: int) -> dict:
+    response = client.search(query=query, num_results=num_results)
+    _get_tavily_cache().set(_search_key(query, num_results), json.dumps(response), expire=TAVILY_CACHE_TTL)
+    return response
+
+
+def cached_search(client: TavilyClient, query: str, num_results: int = 5) -> dict:
+    """Runs `client.search`, reusing results for the same query for up to TAVILY_CACHE_TTL seconds."""
+    cached = _get_cached_search(query, num_results)
+    if cached is not None:
+        return cached
+    return _search_and_store(client, query, num_results)
+
+
+async def acached_search(client: TavilyClient, query: str, num_results: int = 5) -> dict:
+    """Async `cached_search`: the cache lookup runs off the event loop, misses run on the Tavily thread pool."""
+    # ✅ Off the loop so a slow cache write on a pool thread doesn't block other coroutines
+    cached = await asyncio.to_thread(_get_cached_search, query, num_results)
+    if cached is not None:
+        return cached
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_tavily_pool, _search_and_store, client, query, num_results)
+
+
+async def stream_answer(
+    open_client,
+    llm_cache: LLMCache,
+    prompt: str,
+    writer,
+    max_new_tokens: int,
+    semantic_text: Optional[str] = None,
+) -> tuple:
+    """Returns `(answer, from_cache)` for `prompt`, passing {"token": ...} events to `writer` as they are decoded.
+
+    `open_client()` lends the Hugging Face client, e.g. `inference_client(model)`. `semantic_text` must
+    carry the user's query (see `LLMCache.cache_key`). A cached answer is written as a single token;
+    concurrent calls with the same prompt and query share one request.
+    """
+    cached = await asyncio.to_thread(llm_cache.get, prompt, semantic_text)
+    if cached is not None:
+        writer({"token": cached})
+        return cached, True
+
+    streamed = False
+
+    async def generate():
+        # ✅ Stream tokens to the caller as they are decoded
+        nonlocal streamed
+        streamed = True
+        tokens = []
+        # ✅ The shared request holds its own lease, so it outlives the run that started it
+        async with open_client() as hf_client:
+            async for token in await hf_client.text_generation(
+                prompt, max_new_tokens=max_new_tokens, stop=STOP_SEQUENCES, stream=True, details=False
+            ):
+                tokens.append(token)
+                writer({"token": token})
+        return "".join(tokens)
+
+    # ✅ Concurrent runs with the same prompt share a single Hugging Face request
+    response = await llm_cache.coalesce(prompt, generate, semantic_text)
+    if not streamed:
+        writer({"token": response})
+    return response, False
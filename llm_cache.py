@@ -0,0 +1,249 @@
+import asyncio
+import base64
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Iterator, Optional, Protocol, Tuple
+
+# ✅ Optional dependencies for the semantic cache; exact-match caching works without them
+try:
+    import faiss
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    faiss = None
+
+DEFAULT_CACHE_PATH = ".llm_cache.sqlite"
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+DEFAULT_SIMILARITY_THRESHOLD = 0.95
+
+# ✅ Answers go stale together with the Tavily results they were drafted from (clients.TAVILY_CACHE_TTL)
+DEFAULT_CACHE_TTL = 3600
+
+
+class CacheBackend(Protocol):
+    """Key/value storage used by the caches."""
+
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    def set(self, key: str, value: str, expire: Optional[float] = None) -> None:
+        ...
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        ...
+
+
+class MemoryBackend:
+    """Keeps cache entries in a process-local dict."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            return value
+
+    def set(self, key: str, value: str, expire: Optional[float] = None) -> None:
+        expires_at = time.time() + expire if expire is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        now = time.time()
+        with self._lock:
+            entries = list(self._entries.items())
+        for key, (value, expires_at) in entries:
+            if expires_at is None or expires_at > now:
+                yield key, value
+
+
+class SQLiteBackend:
+    """Persists cache entries in a SQLite file so they survive restarts."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            # ✅ Drop rows that expired since the file was last opened so it doesn't grow without bound
+            self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, expire: Optional[float] = None) -> None:
+        expires_at = time.time() + expire if expire is not None else None
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+
+    def items(self) -> Iterator[Tuple[str, str]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, value FROM cache WHERE expires_at IS NULL OR expires_at > ?",
+                (time.time(),),
+            ).fetchall()
+        yield from rows
+
+
+class LLMCache:
+    """Caches LLM responses by exact prompt hash, falling back to semantic similarity."""
+
+    def __init__(
+        self,
+        model: str,
+        namespace: str = "",
+        backend: Optional[CacheBackend] = None,
+        similarity_threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+        embedding_model: str = DEFAULT_EMBEDDING_MODEL,
+        ttl: Optional[float] = DEFAULT_CACHE_TTL,
+    ):
+        self.model = model
+        self.namespace = namespace
+        self.backend = backend if backend is not None else SQLiteBackend()
+        self.similarity_threshold = similarity_threshold
+        self.embedding_model = embedding_model
+        self.ttl = ttl
+        self._encoder = None
+        self._index = None
+        self._responses = []
+        self._expires = []
+        self._index_built_at = 0.0
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def cache_key(self, prompt: str, semantic_text: Optional[str] = None) -> str:
+        """Returns the exact-match key for `prompt` and `semantic_text` on this cache's model and namespace.
+
+        The prompt templates don't contain the user's query, so callers pass it in `semantic_text`;
+        otherwise two queries with the same research context would share an answer.
+        """
+        parts = [self.model, self.namespace, prompt, semantic_text or prompt]
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def get(self, prompt: str, semantic_text: Optional[str] = None):
+        """Returns the cached response for `prompt`, or None on a miss.
+
+        `semantic_text` is embedded for the similarity lookup; it defaults to the prompt and
+        should fit the embedding model's input window, since longer text is truncated.
+        """
+        value = self.backend.get(self.cache_key(prompt, semantic_text))
+        if value is not None:
+            return json.loads(value)["response"]
+
+        if faiss is None:
+            return None
+
+        with self._lock:
+            self._load_index()
+            if self._index.ntotal == 0:
+                return None
+            scores, ids = self._index.search(self._embed([semantic_text or prompt]), 1)
+
+        best = ids[0][0]
+        if scores[0][0] >= self.similarity_threshold and not self._expired(self._expires[best]):
+            return self._responses[best]
+        return None
+
+    def set(self, prompt: str, response, semantic_text: Optional[str] = None) -> None:
+        """Stores `response` for `prompt` for `ttl` seconds."""
+        key = self.cache_key(prompt, semantic_text)
+        semantic_text = semantic_text or prompt
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        entry = {
+            "model": self.model,
+            "namespace": self.namespace,
+            "prompt": prompt,
+            "semantic_text": semantic_text,
+            "response": response,
+            "expires_at": expires_at,
+        }
+
+        if faiss is not None:
+            with self._lock:
+                self._load_index()
+                vector = self._embed([semantic_text])
+                self._index.add(vector)
+                self._responses.append(response)
+                self._expires.append(expires_at)
+
+            # ✅ Keep the vector with the row so later processes don't re-embed the whole cache
+            entry["embedding_model"] = self.embedding_model
+            entry["embedding"] = base64.b64encode(vector[0].tobytes()).decode("ascii")
+
+        self.backend.set(key, json.dumps(entry), expire=self.ttl)
+
+    async def coalesce(self, prompt: str, generate, semantic_text: Optional[str] = None):
+        """Awaits `generate()` once for concurrent calls with the same cache key; duplicates share its result."""
+        key = (asyncio.get_running_loop(), self.cache_key(prompt, semantic_text))
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(generate())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # ✅ Shield so one cancelled caller doesn't cancel the request the others are waiting on
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _expired(expires_at) -> bool:
+        return expires_at is not None and expires_at <= time.time()
+
+    def _embed(self, texts):
+        vectors = self._encoder.encode(texts, normalize_embeddings=True)
+        return np.asarray(vectors, dtype="float32")
+
+    def _load_index(self):
+        """Builds the FAISS index from the vectors stored in the backend on first use.
+
+        The index is rebuilt once per `ttl` so expired answers leave memory as well as the backend.
+        """
+        if self._index is not None and (self.ttl is None or time.time() - self._index_built_at < self.ttl):
+            return
+
+        if self._encoder is None:
+            self._encoder = SentenceTransformer(self.embedding_model)
+        self._index = faiss.IndexFlatIP(self._encoder.get_sentence_embedding_dimension())
+        self._responses, self._expires = [], []
+        self._index_built_at = time.time()
+
+        entries = [json.loads(value) for _, value in self.backend.items()]
+        # ✅ Only match answers produced by the same model and prompt template, embedded by this encoder
+        entries = [
+            entry for entry in entries
+            if entry.get("model") == self.model
+            and entry.get("namespace") == self.namespace
+            and entry.get("embedding_model") == self.embedding_model
+        ]
+        if entries:
+            vectors = [np.frombuffer(base64.b64decode(entry["embedding"]), dtype="float32") for entry in entries]
+            self._index.add(np.stack(vectors))
+            self._responses = [entry["response"] for entry in entries]
+            self._expires = [entry.get("expires_at") for entry in entries]
+
+
+@lru_cache(maxsize=None)
+def get_llm_cache(model: str, namespace: str = "") -> LLMCache:
+    """Returns the process-wide LLMCache for `model` and the prompt template named by `namespace`."""
+    return LLMCache(model=model, namespace=namespace)
@@ -1,59 +1,99 @@
-import os
+import asyncio
+import logging
+import sys
+import unicodedata
 import requests
-from dotenv import load_dotenv
-from dataclasses import dataclass
+import operator
+from functools import lru_cache
+from typing import Annotated, TypedDict
 from langgraph.graph import StateGraph, END
-from tavily import TavilyClient  # ✅ Tavily for web search
-from huggingface_hub import InferenceClient
+from langgraph.types import StreamWriter
+from checkpoints import ANSWER_OK, run_query, stream_query  # ✅ Reuse answers for repeated queries
+from clients import acached_search, get_huggingface_api_key, get_hf_model, get_tavily_client, inference_client, run_sync, stream_answer  # ✅ Shared Tavily + Hugging Face clients
+from llm_cache import get_llm_cache  # ✅ Exact + semantic cache for LLM answers
+from research_context import answer_token_budget, build_research_context, semantic_digest  # ✅ Prompt + generation budgets
 
-# ✅ Load API Keys from .env file
-load_dotenv()
-tavily_api_key = os.getenv("TAVILY_API_KEY")
-huggingface_api_key = os.getenv("HUGGINGFACEHUB_API_KEY")
+log = logging.getLogger(__name__)
 
-# ✅ Validate API Keys
-if not tavily_api_key:
-    raise ValueError("❌ Tavily API key is missing. Check your .env file.")
-if not huggingface_api_key:
-    raise ValueError("❌ Hugging Face API key is missing. Check your .env file.")
-
-# ✅ Initialize Tavily Client
-client = TavilyClient(api_key=tavily_api_key)
+# ✅ Number of Tavily sub-queries searched in parallel
+NUM_SUBQUERIES = 3
+SEARCH_FACETS = ["overview", "latest findings"]
 
 # ✅ Define Research State
-@dataclass
-class ResearchState:
+class ResearchState(TypedDict):
     query: str
-    research_data: list
+    research_data: Annotated[list, operator.add]  # ✅ Merges parallel search results
     answer_draft: str
-
-def research_agent(state: ResearchState):
-    """Uses TavilyClient to get web search results."""
-    print(f"🔍 Researching: {state.query}")
-    
-    try:
-        response = client.search(query=state.query, num_results=5)
-        research_data = [res.get("content", "No content available.") for res in response.get("results", [])]
-        
-        if not research_data or all(not item.strip() for item in research_data):
-            print("⚠️ No useful search results found.")
-            research_data = ["No relevant search results."]
-        
-        return ResearchState(query=state.query, research_data=research_data, answer_draft="")
-    except Exception as e:
-        print(f"❌ Tavily API error: {e}")
-        return ResearchState(query=state.query, research_data=["Error fetching results"], answer_draft="")
-
-# ✅ Initialize Hugging Face Client
-hf_client = InferenceClient(model="tiiuae/falcon-7b-instruct", token=huggingface_api_key)
+    status: str  # ✅ ANSWER_OK once the draft is a reusable answer
+    subqueries: list
+
+def planner_agent(state: ResearchState):
+    """Decomposes the query into sub-queries that are searched in parallel."""
+    query = state["query"]
+    subqueries = [query] + [f"{query} {facet}" for facet in SEARCH_FACETS]
+    return {"subqueries": subqueries[:NUM_SUBQUERIES]}
+
+def make_research_agent(index):
+    """Builds the search node that handles the sub-query at `index`."""
+    async def research_agent(state: ResearchState):
+        """Uses TavilyClient to get web search results."""
+        if index >= len(state["subqueries"]):
+            return {"research_data": []}
+
+        subquery = state["subqueries"][index]
+        client = get_tavily_client()  # ✅ Raises here if the Tavily API key is missing
+        log.info("🔍 Researching: %s", subquery)
+
+        try:
+            response = await acached_search(client, subquery, num_results=5)
+            research_data = [res.get("content", "No content available.") for res in response.get("results", [])]
+
+            return {"research_data": [item for item in research_data if item.strip()]}
+        except Exception as e:
+            log.error("❌ Tavily API error: %s", e)
+            return {"research_data": []}
+
+    return research_agent
+
+# ✅ Default Hugging Face model; override with HF_MODEL / HF_PROVIDER in .env
+DEFAULT_HF_MODEL = "tiiuae/falcon-7b-instruct"
+
+# ✅ Keeps this script's cached answers and checkpoints apart from the other scripts' prompt templates
+PROMPT_NAMESPACE = "maincode"
+
+def open_hf_client():
+    """Lends this event loop's Hugging Face client for one request; use it with `async with`."""
+    return inference_client(get_hf_model(DEFAULT_HF_MODEL), get_huggingface_api_key())
+
+# ✅ Control and invisible formatting characters (incl. bidi overrides/isolates), keeping newlines and tabs
+INVISIBLE_CATEGORIES = {"Cc", "Cf", "Zl", "Zp"}
+
+@lru_cache(maxsize=1)
+def _non_printable_table():
+    """Builds the str.translate table on first use; scanning every code point takes ~150 ms."""
+    return dict.fromkeys(
+        code for code in range(sys.maxunicode + 1)
+        if unicodedata.category(chr(code)) in INVISIBLE_CATEGORIES and chr(code) not in "\n\t"
+    )
 
 def sanitize_response(response_text):
     """Removes corrupted characters from AI output."""
-    return ''.join(char for char in response_text if char.isprintable())
+    return response_text.translate(_non_printable_table())
 
-def answer_drafting_agent(state: ResearchState):
+async def answer_drafting_agent(state: ResearchState, writer: StreamWriter):
     """Generates an answer using Hugging Face inference API."""
-    print("✍️ Generating answer using Hugging Face...")
+    log.info("✍️ Generating answer using Hugging Face...")
+
+    research_data = state["research_data"]
+    if not research_data:
+        log.warning("⚠️ No useful search results found.")
+        research_data = ["No relevant search results."]
+
+    # ✅ Keep the prompt short: drop near-duplicate snippets and cap the context size
+    research_context = build_research_context(research_data)
+
+    get_huggingface_api_key()  # ✅ Raises here if the Hugging Face API key is missing
+    llm_cache = get_llm_cache(get_hf_model(DEFAULT_HF_MODEL), PROMPT_NAMESPACE)
     
     try:
         prompt = f"""
@@ -61,59 +101,77 @@ def answer_drafting_agent(state: ResearchState):
         Avoid excessive bullet points or repetitive information. Make the answer concise and readable.
 
         Research Data:
-        {state.research_data}
+        {research_context}
 
         Format the answer with short paragraphs and use headings when necessary.
         """
         
-        response = hf_client.text_generation(prompt, max_new_tokens=500)
-        print("🔎 Raw Hugging Face Response:", response)
+        # ✅ Serve repeated or near-duplicate prompts from the cache, streaming fresh answers token by token
+        semantic_text = semantic_digest(state["query"], research_data)
+        response, cached = await stream_answer(
+            open_hf_client, llm_cache, prompt, writer, answer_token_budget(state["query"]), semantic_text
+        )
+        log.debug("🔎 Raw Hugging Face Response: %s", response)
 
         answer_text = sanitize_response(response.strip()) if isinstance(response, str) else "Error: No answer generated."
 
+        status = ANSWER_OK if state["research_data"] else "no_results"
         # Clean up and reformat the response
         if not answer_text or "\uFFFD" in answer_text:
-            print("⚠️ Invalid AI response detected. Retrying with fallback response...")
+            log.warning("⚠️ Invalid AI response detected. Retrying with fallback response...")
             answer_text = "Error: The AI response was corrupted. Please try again."
+            status = "error"
+        elif not cached and state["research_data"]:
+            # ✅ Drafts built from the no-results fallback aren't cached
+            await asyncio.to_thread(llm_cache.set, prompt, response, semantic_text)
 
         # Post-process to remove excessive bullet points and format properly
         cleaned_answer = '\n'.join(line for line in answer_text.split('\n') if line.strip())  # Remove empty lines
         cleaned_answer = cleaned_answer.replace("•", "-")  # Replace bullet points with dashes
 
-        return ResearchState(query=state.query, research_data=state.research_data, answer_draft=cleaned_answer)
+        return {"answer_draft": cleaned_answer, "status": status}
     except Exception as e:
-        print(f"❌ Hugging Face API error: {e}")
-        return ResearchState(query=state.query, research_data=state.research_data, answer_draft="Error fetching response.")
+        log.error("❌ Hugging Face API error: %s", e)
+        return {"answer_draft": "Error fetching response.", "status": "error"}
 
 # ✅ Define LangGraph Workflow
 graph = StateGraph(ResearchState)
-graph.add_node("research", research_agent)
+graph.add_node("planner", planner_agent)
 graph.add_node("draft", answer_drafting_agent)
 
-graph.add_edge("research", "draft")
+# ✅ Fan out to parallel search nodes, fan in to the single writer
+for i in range(NUM_SUBQUERIES):
+    graph.add_node(f"search_{i + 1}", make_research_agent(i))
+    graph.add_edge("planner", f"search_{i + 1}")
+    graph.add_edge(f"search_{i + 1}", "draft")
+
 graph.add_edge("draft", END)
-graph.set_entry_point("research")
+graph.set_entry_point("planner")
 
+# ✅ Compile once at import; each run binds its own on-disk checkpoint store
 executor = graph.compile()
 
+async def arun_research_system(user_query):
+    """Runs the research system for `user_query`, reusing a recent finished answer for the same query."""
+    state = ResearchState(query=user_query, research_data=[], answer_draft="", subqueries=[], status="")
+    log.debug("🔎 Initial State: %s", state)
+    return await run_query(executor, state, PROMPT_NAMESPACE)
+
 def run_research_system(user_query):
-    state = ResearchState(query=user_query, research_data=[], answer_draft="")
-    print("🔎 Initial State:", state)  # Log the initial state
-    
-    final_state = executor.invoke(state)
-    
-    print("🔎 Final state:", final_state)  # Debugging print
-    print("Type of final state:", type(final_state))  # Check the type of final state
+    """Runs the research system to completion from synchronous code."""
+    return run_sync(arun_research_system(user_query))
 
-    if isinstance(final_state, dict):  
-        final_state = ResearchState(**final_state)  # Convert to ResearchState
+async def run_many(queries):
+    """Runs the research system for several queries concurrently; they share one Hugging Face client."""
+    return await asyncio.gather(*(arun_research_system(query) for query in queries))
 
-    if isinstance(final_state, ResearchState):
-        return final_state.answer_draft or "Error: No answer generated."
-    else:
-        return f"Error: Unexpected final state structure. Received type: {type(final_state)}"
+def stream_research_system(user_query):
+    """Yields {"token": ...} events while the answer is generated, then {"answer": ...}."""
+    state = ResearchState(query=user_query, research_data=[], answer_draft="", subqueries=[], status="")
+    return stream_query(executor, state, PROMPT_NAMESPACE)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     query = input("Enter your research query: ")
     answer = run_research_system(query)
     print("\n💡 Final Answer:\n", answer)
@@ -0,0 +1,62 @@
+# ✅ Prompt budget for retrieved web content
+SNIPPET_CHAR_LIMIT = 1500
+CONTEXT_CHAR_BUDGET = 6000
+SNIPPET_SEPARATOR = "\n\n"
+
+# ✅ Generation budget: short queries get short answers, long ones keep the full cap
+MAX_NEW_TOKENS = 500
+BASE_NEW_TOKENS = 128
+NEW_TOKENS_PER_QUERY_WORD = 16
+STOP_SEQUENCES = ["\n\n\n"]
+
+# ✅ Semantic cache text must fit all-MiniLM-L6-v2's 256-wordpiece window
+SEMANTIC_WORD_BUDGET = 128
+SEMANTIC_WORDS_PER_SNIPPET = 16
+
+# ✅ Snippets sharing this fraction of word 5-grams count as duplicates
+DUPLICATE_THRESHOLD = 0.8
+SHINGLE_SIZE = 5
+
+
+def _shingles(text):
+    """Returns the set of lower-cased word n-grams in `text`."""
+    words = text.lower().split()
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def dedup_snippets(snippets):
+    """Drops snippets that are near-duplicates of an earlier one."""
+    kept, kept_shingles = [], []
+    for snippet in snippets:
+        shingles = _shingles(snippet)
+        if any(_jaccard(shingles, other) >= DUPLICATE_THRESHOLD for other in kept_shingles):
+            continue
+        kept.append(snippet)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def build_research_context(snippets):
+    """Deduplicates, numbers and truncates search results into the prompt's research context."""
+    trimmed = [snippet[:SNIPPET_CHAR_LIMIT] for snippet in dedup_snippets(snippets)]
+    numbered = [f"[{i + 1}] {snippet}" for i, snippet in enumerate(trimmed)]
+    return SNIPPET_SEPARATOR.join(numbered)[:CONTEXT_CHAR_BUDGET]
+
+
+def semantic_digest(query, snippets):
+    """Returns the query followed by the opening words of each distinct snippet, for the semantic cache."""
+    words = query.split()
+    for snippet in dedup_snippets(snippets):
+        words += snippet.split()[:SEMANTIC_WORDS_PER_SNIPPET]
+    return " ".join(words[:SEMANTIC_WORD_BUDGET])
+
+
+def answer_token_budget(query):
+    """Returns the max_new_tokens budget for answering `query`."""
+    return min(MAX_NEW_TOKENS, BASE_NEW_TOKENS + NEW_TOKENS_PER_QUERY_WORD * len(query.split()))
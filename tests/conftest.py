@@ -0,0 +1,19 @@
+import pytest
+
+import clients
+import llm_cache
+
+
+@pytest.fixture(autouse=True)
+def isolated_caches(tmp_path, monkeypatch):
+    """Runs each test in its own directory so the SQLite caches and checkpoints start empty."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TAVILY_API_KEY", "test-tavily-key")
+    monkeypatch.setenv("HUGGINGFACEHUB_API_KEY", "test-hf-key")
+    # ✅ Keep tests offline: the semantic cache is only exercised with a fake encoder
+    monkeypatch.setattr(llm_cache, "faiss", None)
+    clients._get_tavily_cache.cache_clear()
+    llm_cache.get_llm_cache.cache_clear()
+    yield
+    clients._get_tavily_cache.cache_clear()
+    llm_cache.get_llm_cache.cache_clear()
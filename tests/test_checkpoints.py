@@ -0,0 +1,113 @@
+import asyncio
+import operator
+from typing import Annotated, TypedDict
+
+from langgraph.graph import END, StateGraph
+
+import checkpoints
+from checkpoints import ANSWER_OK, checkpointed, clear_thread, finished_answer, query_config, thread_lock
+
+
+class State(TypedDict):
+    research_data: Annotated[list, operator.add]
+    answer_draft: str
+    status: str
+
+
+def draft(state: State):
+    return {
+        "research_data": ["snippet"],
+        "answer_draft": state["answer_draft"] or "An answer.",
+        "status": state["status"] or ANSWER_OK,
+    }
+
+
+def inputs(answer_draft="", status=""):
+    return {"research_data": [], "answer_draft": answer_draft, "status": status}
+
+
+async def start(executor, config, **kwargs):
+    await clear_thread(executor, config)
+    return await executor.ainvoke(inputs(**kwargs), config=config)
+
+
+def build_graph():
+    graph = StateGraph(State)
+    graph.add_node("draft", draft)
+    graph.set_entry_point("draft")
+    graph.add_edge("draft", END)
+    return graph
+
+
+def run(coro_fn):
+    async def main():
+        async with checkpointed(build_graph().compile()) as executor:
+            return await coro_fn(executor)
+    return asyncio.run(main())
+
+
+def test_query_config_is_stable_and_namespaced():
+    assert query_config("colds") == query_config("colds")
+    assert query_config("colds", "newmain") != query_config("colds", "accuracy")
+    assert query_config("colds") != query_config("flu")
+
+
+def test_thread_lock_is_shared_per_thread_within_a_loop():
+    async def main():
+        return thread_lock(query_config("a")), thread_lock(query_config("a")), thread_lock(query_config("b"))
+
+    first, same, other = asyncio.run(main())
+    assert first is same
+    assert first is not other
+
+
+def test_finished_answer_is_reused_across_event_loops():
+    config = query_config("colds")
+    run(lambda executor: executor.ainvoke(inputs(), config=config))
+    assert run(lambda executor: finished_answer(executor, config)) == "An answer."
+
+
+def test_finished_answer_skips_errors_and_stale_runs(monkeypatch):
+    failed, empty, fresh = query_config("failed"), query_config("no results"), query_config("fresh")
+    run(lambda executor: executor.ainvoke(inputs("Error fetching response.", "error"), config=failed))
+    run(lambda executor: executor.ainvoke(inputs("An answer.", "no_results"), config=empty))
+    run(lambda executor: executor.ainvoke(inputs(), config=fresh))
+
+    assert run(lambda executor: finished_answer(executor, failed)) is None
+    assert run(lambda executor: finished_answer(executor, empty)) is None
+    assert run(lambda executor: finished_answer(executor, query_config("never run"))) is None
+
+    monkeypatch.setattr(checkpoints, "CHECKPOINT_TTL", -1)
+    assert run(lambda executor: finished_answer(executor, fresh)) is None
+
+
+def test_clear_thread_stops_research_data_accumulating():
+    config = query_config("colds")
+
+    async def rerun(executor):
+        await executor.ainvoke(inputs(), config=config)
+        await clear_thread(executor, config)
+        await executor.ainvoke(inputs(), config=config)
+        return (await executor.aget_state(config)).values["research_data"]
+
+    assert run(rerun) == ["snippet"]
+
+
+def test_finished_answer_is_judged_by_status_not_text():
+    config = query_config("errors")
+    run(lambda executor: executor.ainvoke(inputs("Error handling in Python uses exceptions."), config=config))
+    assert run(lambda executor: finished_answer(executor, config)) == "Error handling in Python uses exceptions."
+
+
+def test_expired_threads_are_deleted_on_open(monkeypatch):
+    kept, expired = query_config("kept"), query_config("expired")
+    run(lambda executor: start(executor, kept))
+    monkeypatch.setattr(checkpoints, "CHECKPOINT_TTL", -1)
+    run(lambda executor: start(executor, expired))
+
+    async def states(executor):
+        return (await executor.aget_state(kept)).values, (await executor.aget_state(expired)).values
+
+    kept_values, expired_values = run(states)
+    assert kept_values["answer_draft"] == "An answer."
+    assert expired_values == {}
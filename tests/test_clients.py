@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+import clients
+from llm_cache import LLMCache, MemoryBackend
+
+
+class FakeInferenceClient:
+    def __init__(self, model=None, **kwargs):
+        self.model = model
+        self.closed = False
+        self.requests = 0
+        self.release = asyncio.Event()
+
+    async def close(self):
+        self.closed = True
+
+    async def text_generation(self, prompt, **kwargs):
+        self.requests += 1
+
+        async def stream():
+            for token in ["Rhinoviruses", " cause", " colds."]:
+                await self.release.wait()
+                if self.closed:
+                    raise RuntimeError("client is closed")
+                yield token
+        return stream()
+
+
+@pytest.fixture(autouse=True)
+def fake_clients(monkeypatch):
+    monkeypatch.setattr(clients, "AsyncInferenceClient", FakeInferenceClient)
+
+
+def test_inference_client_is_shared_per_loop_and_closed_with_it():
+    async def lease_twice():
+        async with clients.inference_client("model") as first, clients.inference_client("model") as second:
+            pass
+        assert not first.closed
+        await clients.close_inference_clients()
+        return first, second
+
+    first, second = asyncio.run(lease_twice())
+    other, _ = asyncio.run(lease_twice())
+    assert first is second
+    assert first.closed and other.closed
+    assert other is not first
+
+
+def test_inference_client_is_recycled_after_max_leases(monkeypatch):
+    monkeypatch.setattr(clients, "HF_CLIENT_MAX_LEASES", 2)
+
+    async def main():
+        async with clients.inference_client("model") as held:
+            async with clients.inference_client("model"):
+                pass
+            async with clients.inference_client("model") as fresh:
+                assert fresh is not held
+            # ✅ The retired client stays open while a lease still uses it
+            assert not held.closed
+        assert held.closed
+        assert not fresh.closed
+        await clients.close_inference_clients()
+        assert fresh.closed
+
+    asyncio.run(main())
+
+
+def test_run_sync_closes_the_loops_clients():
+    async def lease():
+        async with clients.inference_client("model") as client:
+            return client
+
+    assert clients.run_sync(lease()).closed
+
+
+def test_shared_request_survives_the_cancelled_run_that_started_it(monkeypatch):
+    monkeypatch.setattr(clients, "HF_CLIENT_MAX_LEASES", 1)
+    cache = LLMCache("model", backend=MemoryBackend())
+
+    async def main():
+        owner_tokens, other_tokens = [], []
+        owner = asyncio.ensure_future(
+            clients.stream_answer(lambda: clients.inference_client("model"), cache, "prompt", owner_tokens.append, 64)
+        )
+        await asyncio.sleep(0.01)
+        other = asyncio.ensure_future(
+            clients.stream_answer(lambda: clients.inference_client("model"), cache, "prompt", other_tokens.append, 64)
+        )
+        await asyncio.sleep(0.01)
+        client = clients._loop_clients[asyncio.get_running_loop()][("model", None)].client
+
+        # ✅ Another request retires the busy client, then the run that started the shared request goes away
+        async with clients.inference_client("model") as replacement:
+            assert replacement is not client
+        owner.cancel()
+        await asyncio.sleep(0)
+        assert not client.closed
+
+        client.release.set()
+        answer = await other
+        await clients.close_inference_clients()
+        return answer, client
+
+    answer, client = asyncio.run(main())
+    assert answer == ("Rhinoviruses cause colds.", False)
+    assert client.requests == 1
+    assert client.closed
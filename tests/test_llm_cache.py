@@ -0,0 +1,145 @@
+import asyncio
+import json
+
+import pytest
+
+import llm_cache
+from llm_cache import LLMCache, MemoryBackend, SQLiteBackend
+
+
+@pytest.mark.parametrize("make_backend", [MemoryBackend, lambda: SQLiteBackend("cache.sqlite")])
+def test_backend_get_set_and_expiry(make_backend):
+    backend = make_backend()
+    backend.set("fresh", "a")
+    backend.set("stale", "b", expire=-1)
+    assert backend.get("fresh") == "a"
+    assert backend.get("stale") is None
+    assert backend.get("missing") is None
+    assert list(backend.items()) == [("fresh", "a")]
+
+
+def test_sqlite_backend_persists_across_instances():
+    SQLiteBackend("cache.sqlite").set("key", "value")
+    assert SQLiteBackend("cache.sqlite").get("key") == "value"
+
+
+def test_exact_match_is_scoped_by_model_and_namespace():
+    backend = MemoryBackend()
+    LLMCache("model-a", "newmain", backend).set("prompt", "answer")
+    assert LLMCache("model-a", "newmain", backend).get("prompt") == "answer"
+    assert LLMCache("model-a", "accuracy", backend).get("prompt") is None
+    assert LLMCache("model-b", "newmain", backend).get("prompt") is None
+
+
+def test_exact_match_is_scoped_by_query():
+    cache = LLMCache("model", backend=MemoryBackend())
+    cache.set("prompt", "answer about colds", semantic_text="what causes colds")
+    assert cache.get("prompt", "what causes colds") == "answer about colds"
+    assert cache.get("prompt", "what is the bitcoin price") is None
+
+
+def test_coalesce_shares_one_call_for_concurrent_identical_prompts():
+    cache = LLMCache("model", backend=MemoryBackend())
+    calls = []
+
+    def make_generate(prompt):
+        async def generate():
+            calls.append(prompt)
+            await asyncio.sleep(0.01)
+            return f"answer to {prompt}"
+        return generate
+
+    async def main():
+        return await asyncio.gather(
+            cache.coalesce("p1", make_generate("p1")),
+            cache.coalesce("p1", make_generate("p1")),
+            cache.coalesce("p2", make_generate("p2")),
+        )
+
+    assert asyncio.run(main()) == ["answer to p1", "answer to p1", "answer to p2"]
+    assert calls == ["p1", "p2"]
+    assert cache._inflight == {}
+
+
+def test_coalesce_survives_a_cancelled_caller():
+    cache = LLMCache("model", backend=MemoryBackend())
+
+    async def generate():
+        await asyncio.sleep(0.02)
+        return "answer"
+
+    async def main():
+        first = asyncio.ensure_future(cache.coalesce("p", generate))
+        second = asyncio.ensure_future(cache.coalesce("p", generate))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "answer"
+
+
+class FakeEncoder:
+    """Deterministic bag-of-words embeddings so the semantic path runs offline."""
+
+    DIM = 64
+    encoded = []
+
+    def __init__(self, name):
+        pass
+
+    def get_sentence_embedding_dimension(self):
+        return self.DIM
+
+    def encode(self, texts, normalize_embeddings=True):
+        import numpy as np
+
+        FakeEncoder.encoded.extend(texts)
+        vectors = np.zeros((len(texts), self.DIM), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, sum(word.encode("utf-8")) % self.DIM] += 1.0
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def semantic(monkeypatch):
+    faiss = pytest.importorskip("faiss")
+    numpy = pytest.importorskip("numpy")
+    # ✅ raising=False: these names are missing when sentence-transformers isn't installed
+    monkeypatch.setattr(llm_cache, "faiss", faiss)
+    monkeypatch.setattr(llm_cache, "np", numpy, raising=False)
+    monkeypatch.setattr(llm_cache, "SentenceTransformer", FakeEncoder, raising=False)
+    monkeypatch.setattr(FakeEncoder, "encoded", [])
+
+
+def test_semantic_match_is_scoped_by_namespace(semantic):
+    backend = MemoryBackend()
+    LLMCache("model", "newmain", backend).set("prompt one", "answer", semantic_text="common cold causes")
+
+    assert LLMCache("model", "newmain", backend).get("prompt two", "common cold causes") == "answer"
+    assert LLMCache("model", "accuracy", backend).get("prompt two", "common cold causes") is None
+    assert LLMCache("model", "newmain", backend).get("prompt two", "jupiter moons orbit") is None
+    assert json.loads(next(iter(backend.items()))[1])["namespace"] == "newmain"
+
+
+def test_semantic_index_loads_stored_vectors_without_re_embedding(semantic):
+    backend = SQLiteBackend("cache.sqlite")
+    LLMCache("model", "newmain", backend).set("prompt one", "answer", semantic_text="common cold causes")
+    FakeEncoder.encoded.clear()
+
+    restarted = LLMCache("model", "newmain", SQLiteBackend("cache.sqlite"))
+    assert restarted.get("prompt two", "common cold causes") == "answer"
+    assert FakeEncoder.encoded == ["common cold causes"]
+
+
+def test_expired_answers_are_not_served(semantic):
+    cache = LLMCache("model", backend=MemoryBackend(), ttl=-1)
+    cache.set("prompt", "answer", semantic_text="common cold causes")
+    assert cache.get("prompt", "common cold causes") is None
+    assert cache.get("other prompt", "common cold causes") is None
+
+
+def test_sqlite_backend_drops_expired_rows_when_opened():
+    SQLiteBackend("cache.sqlite").set("stale", "value", expire=-1)
+    backend = SQLiteBackend("cache.sqlite")
+    assert backend._conn.execute("SELECT COUNT(*) FROM cache").fetchone() == (0,)
@@ -0,0 +1,43 @@
+from research_context import (
+    CONTEXT_CHAR_BUDGET,
+    MAX_NEW_TOKENS,
+    SEMANTIC_WORD_BUDGET,
+    SEMANTIC_WORDS_PER_SNIPPET,
+    SNIPPET_CHAR_LIMIT,
+    answer_token_budget,
+    build_research_context,
+    dedup_snippets,
+    semantic_digest,
+)
+
+SNIPPET = "The common cold is a viral infection of the nose and throat caused mostly by rhinoviruses."
+
+
+def test_dedup_snippets_drops_near_duplicates():
+    near_duplicate = SNIPPET.replace("mostly", "mainly")
+    other = "Influenza spreads through respiratory droplets and can cause fever, aches and fatigue."
+    assert dedup_snippets([SNIPPET, SNIPPET.upper(), other]) == [SNIPPET, other]
+    assert dedup_snippets([SNIPPET, near_duplicate]) == [SNIPPET, near_duplicate]
+
+
+def test_build_research_context_numbers_and_truncates():
+    context = build_research_context([SNIPPET, "x" * (SNIPPET_CHAR_LIMIT + 100)])
+    first, second = context.split("\n\n")
+    assert first == f"[1] {SNIPPET}"
+    assert second == "[2] " + "x" * SNIPPET_CHAR_LIMIT
+
+    distinct = [f"snippet {i} " + " ".join(f"word{i}_{j}" for j in range(300)) for i in range(10)]
+    assert len(build_research_context(distinct)) == CONTEXT_CHAR_BUDGET
+
+
+def test_semantic_digest_keeps_query_first_and_fits_budget():
+    snippets = [" ".join(f"s{i}w{j}" for j in range(100)) for i in range(20)]
+    words = semantic_digest("what causes colds", snippets).split()
+    assert words[:3] == ["what", "causes", "colds"]
+    assert words[3:3 + SEMANTIC_WORDS_PER_SNIPPET] == snippets[0].split()[:SEMANTIC_WORDS_PER_SNIPPET]
+    assert len(words) == SEMANTIC_WORD_BUDGET
+
+
+def test_answer_token_budget_grows_with_query_and_is_capped():
+    assert answer_token_budget("cold") < answer_token_budget("what causes the common cold")
+    assert answer_token_budget("word " * 200) == MAX_NEW_TOKENS
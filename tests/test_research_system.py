@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+
+import clients
+import newmain
+from checkpoints import checkpointed, query_config
+
+
+class FakeTavilyClient:
+    def __init__(self):
+        self.queries = []
+
+    def search(self, query, num_results=5):
+        self.queries.append(query)
+        return {"results": [{"content": f"Findings for {query}: " + "rhinoviruses cause most colds " * 5}]}
+
+
+class FakeInferenceClient:
+    """Streams a fixed answer and, like AsyncInferenceClient, only works on the loop that first used it."""
+
+    def __init__(self, model=None, fail=False, **kwargs):
+        self.model = model
+        self.fail = fail
+        self.loop = None
+        self.closed = False
+        self.requests = 0
+
+    async def close(self):
+        self.closed = True
+
+    async def text_generation(self, prompt, **kwargs):
+        loop = asyncio.get_running_loop()
+        if self.closed or self.loop not in (None, loop):
+            raise RuntimeError("Event loop is closed")
+        self.loop = loop
+        self.requests += 1
+        if self.fail:
+            raise RuntimeError("Hugging Face is unavailable")
+
+        async def stream():
+            for token in ["Rhinoviruses", " cause", " colds."]:
+                yield token
+        return stream()
+
+
+class FailingTavilyClient:
+    def search(self, query, num_results=5):
+        raise RuntimeError("Tavily is unavailable")
+
+
+@pytest.fixture
+def tavily(monkeypatch):
+    client = FakeTavilyClient()
+    monkeypatch.setattr(newmain, "get_tavily_client", lambda: client)
+    return client
+
+
+@pytest.fixture
+def hf_clients(monkeypatch):
+    """Records every Hugging Face client created; tests may queue clients that fail."""
+    opened, queued = [], []
+
+    def make_client(model=None, **kwargs):
+        client = queued.pop(0) if queued else FakeInferenceClient(model)
+        opened.append(client)
+        return client
+
+    monkeypatch.setattr(clients, "AsyncInferenceClient", make_client)
+    return opened, queued
+
+
+def research_data(user_query):
+    async def main():
+        async with checkpointed(newmain.executor) as executor:
+            snapshot = await executor.aget_state(query_config(user_query, newmain.PROMPT_NAMESPACE))
+            return snapshot.values["research_data"]
+    return asyncio.run(main())
+
+
+def test_runs_in_separate_event_loops_each_get_their_loops_client(tavily, hf_clients):
+    opened, _ = hf_clients
+    answers = [newmain.run_research_system(f"what causes colds {i}") for i in range(3)]
+
+    assert answers == ["Rhinoviruses cause colds."] * 3
+    assert len(opened) == 3
+    assert all(client.closed for client in opened)
+
+
+def test_run_many_shares_one_client_on_its_loop(tavily, hf_clients):
+    opened, _ = hf_clients
+
+    async def main():
+        answers = await newmain.run_many([f"what causes colds {i}" for i in range(3)])
+        await clients.close_inference_clients()
+        return answers
+
+    assert asyncio.run(main()) == ["Rhinoviruses cause colds."] * 3
+    assert len(opened) == 1
+    assert opened[0].closed
+
+
+def test_repeated_query_reuses_the_finished_answer(tavily, hf_clients):
+    opened, _ = hf_clients
+    assert newmain.run_research_system("what causes colds") == "Rhinoviruses cause colds."
+    searches = len(tavily.queries)
+
+    assert newmain.run_research_system("what causes colds") == "Rhinoviruses cause colds."
+    assert len(tavily.queries) == searches
+    assert len(opened) == 1 or opened[1].loop is None
+
+
+def test_retry_after_failure_does_not_accumulate_research_data(tavily, hf_clients):
+    _, queued = hf_clients
+    queued.append(FakeInferenceClient("fake-model", fail=True))
+
+    assert newmain.run_research_system("what causes colds") == "Error fetching response."
+    first_run = research_data("what causes colds")
+
+    assert newmain.run_research_system("what causes colds") == "Rhinoviruses cause colds."
+    assert research_data("what causes colds") == first_run
+    assert len(first_run) == newmain.NUM_SUBQUERIES
+
+
+def test_stream_yields_tokens_then_answer(tavily, hf_clients):
+    async def collect():
+        return [event async for event in newmain.stream_research_system("what causes colds")]
+
+    events = asyncio.run(collect())
+    assert events[:-1] == [{"token": "Rhinoviruses"}, {"token": " cause"}, {"token": " colds."}]
+    assert events[-1] == {"answer": "Rhinoviruses cause colds."}
+
+
+def test_queries_without_search_results_are_not_served_each_others_answers(hf_clients, monkeypatch):
+    opened, _ = hf_clients
+    monkeypatch.setattr(newmain, "get_tavily_client", lambda: FailingTavilyClient())
+
+    newmain.run_research_system("what causes colds")
+    newmain.run_research_system("what is the bitcoin price")
+
+    assert [client.requests for client in opened] == [1, 1]
+
+    newmain.run_research_system("what causes colds")  # ✅ No-results answers are drafted again, not reused
+    assert sum(client.requests for client in opened) == 3
+    assert list(newmain.get_llm_cache(newmain.get_hf_model(newmain.DEFAULT_HF_MODEL), newmain.PROMPT_NAMESPACE).backend.items()) == []
+
+
+def test_runs_reuse_the_graph_compiled_at_import(tavily, hf_clients, monkeypatch):
+    def compile_again(*args, **kwargs):
+        raise AssertionError("the graph is compiled once at import")
+
+    monkeypatch.setattr(newmain.graph, "compile", compile_again)
+    assert newmain.run_research_system("what causes colds") == "Rhinoviruses cause colds."